@@ -1,14 +1,21 @@
-from fastapi import FastAPI, HTTPException, Query, Response
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Query, Response, Header
+from fastapi.responses import StreamingResponse, FileResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import quote
 import os
 import aiofiles
 from youtube_service import YouTubeService
 from playlist_service import PlaylistService
 import asyncio
 import tempfile
+import hashlib
+import random
+import queue
+import logging
+import logging.handlers
 
 app = FastAPI(
     title="YouTube Music Player API",
@@ -25,6 +32,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class SelectiveGZipMiddleware:
+    """GZip responses except on routes that serve already-compressed audio"""
+    def __init__(self, app, exclude_prefixes: Tuple[str, ...], **gzip_options):
+        self.app = app
+        self.gzip = GZipMiddleware(app, **gzip_options)
+        self.exclude_prefixes = exclude_prefixes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+class ReleasingFileResponse(FileResponse):
+    """FileResponse that runs a callback once sending ends, even if the client disconnects"""
+    def __init__(self, *args, on_close: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that awaits a callback once sending ends, even if the client disconnects"""
+    def __init__(self, *args, on_close: Callable[[], Awaitable[None]], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+# Compress JSON (playlists, search results); audio passes through untouched
+app.add_middleware(
+    SelectiveGZipMiddleware,
+    exclude_prefixes=("/play/", "/download/", "/redirect/"),
+    minimum_size=1024
+)
+
+# Service log records are only enqueued by the calling (often executor) thread; a listener
+# thread started at startup writes them out
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.handlers.QueueHandler(_log_queue)
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_output)
+_service_logger = logging.getLogger("youtube_service")
+
 # Initialize services
 youtube_service = YouTubeService()
 playlist_service = PlaylistService()
@@ -79,11 +139,13 @@ async def root():
             "/search": "Search for YouTube videos",
             "/stream/{video_id}": "Get audio stream URL for a video",
             "/play/{video_id}": "Stream MP3 audio directly",
+            "/redirect/{video_id}": "Redirect to the audio stream on YouTube's CDN (only for clients sharing this server's public IP; the URL is signed for it)",
             "/download/{video_id}": "Download MP3 file",
             "/playlists": "Playlist management endpoints",
             "/playlists/create": "Create a new playlist",
             "/playlists/{playlist_id}": "Get, update, or delete a playlist",
-            "/playlists/{playlist_id}/songs": "Add or remove songs from playlist"
+            "/playlists/{playlist_id}/songs": "Add or remove songs from playlist",
+            "/playlists/{playlist_id}/songs/bulk": "Add many songs to a playlist in one request"
         }
     }
 
@@ -109,66 +171,68 @@ async def get_audio_stream(video_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/play/{video_id}")
-async def play_audio(video_id: str):
+async def play_audio(video_id: str, range_header: Optional[str] = Header(None, alias="Range")):
     """Stream MP3 audio directly"""
     try:
-        # Get the audio stream URL
-        stream_info = await youtube_service.get_audio_stream_url(video_id)
-        audio_url = stream_info['audio_url']
-        
-        # Create a streaming response that proxies the audio
-        async def generate():
-            import httpx
-            timeout = httpx.Timeout(30.0, connect=10.0)
-            async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-                try:
-                    async with client.stream('GET', audio_url, headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }) as response:
-                        if response.status_code == 200:
-                            async for chunk in response.aiter_bytes(chunk_size=8192):
-                                if chunk:
-                                    yield chunk
-                        else:
-                            raise Exception(f"HTTP {response.status_code}")
-                except Exception as e:
-                    print(f"Streaming error: {e}")
-                    raise
-        
-        return StreamingResponse(
-            generate(),
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": f"inline; filename=\"{stream_info['title']}.mp3\"",
-                "Accept-Ranges": "bytes",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET",
-                "Access-Control-Allow-Headers": "*",
-                "Cache-Control": "no-cache"
-            }
+        # Proxy the audio from the CDN, passing Range through so players can seek
+        stream_info, status_code, upstream_headers, body, close = await youtube_service.stream_audio(
+            video_id, range_header
         )
+        
+        try:
+            # RFC 5987 encoding: titles often contain quotes and non-Latin-1 characters
+            filename = quote(f"{stream_info['title']}.mp3")
+            return ClosingStreamingResponse(
+                body,
+                status_code=status_code,
+                media_type="audio/mpeg",
+                headers={
+                    **upstream_headers,
+                    "Content-Disposition": f"inline; filename*=UTF-8''{filename}",
+                    "Accept-Ranges": "bytes",
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Methods": "GET",
+                    "Access-Control-Allow-Headers": "*",
+                    "Cache-Control": "no-cache"
+                },
+                on_close=close
+            )
+        except Exception:
+            await close()  # Release the pooled CDN connection; the body will never be sent
+            raise
     except Exception as e:
         print(f"Play audio error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/redirect/{video_id}")
+async def redirect_audio(video_id: str):
+    """Redirect to the CDN audio URL so the audio bytes skip this server"""
+    # The URL is signed for this server's IP, so other clients may get 403 and should use /play
+    try:
+        stream_info = await youtube_service.get_audio_stream_url(video_id)
+        return RedirectResponse(
+            url=stream_info['audio_url'],
+            status_code=302,
+            headers={"Cache-Control": "private, max-age=300"}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/download/{video_id}")
 async def download_audio(video_id: str):
     """Download MP3 file"""
     try:
         file_path = await youtube_service.download_audio(video_id)
-        
-        # Get file info for proper headers
-        file_size = os.path.getsize(file_path)
         filename = os.path.basename(file_path)
         
-        return FileResponse(
+        # FileResponse stats the file itself and sets Content-Length; the service keeps
+        # the file from being evicted until it has been sent
+        return ReleasingFileResponse(
             path=file_path,
             filename=filename,
             media_type="audio/mpeg",
-            headers={
-                "Content-Length": str(file_size),
-                "Accept-Ranges": "bytes"
-            }
+            headers={"Accept-Ranges": "bytes"},
+            on_close=lambda: youtube_service.release_download(video_id)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -250,7 +314,7 @@ async def delete_playlist(playlist_id: str):
 async def add_song_to_playlist(playlist_id: str, song: AddSongRequest):
     """Add a song to a playlist"""
     try:
-        song_dict = song.dict()
+        song_dict = song.model_dump()
         playlist = playlist_service.add_song_to_playlist(playlist_id, song_dict)
         if not playlist:
             raise HTTPException(status_code=404, detail="Playlist not found")
@@ -260,6 +324,19 @@ async def add_song_to_playlist(playlist_id: str, song: AddSongRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/playlists/{playlist_id}/songs/bulk")
+async def add_songs_bulk(playlist_id: str, songs: List[AddSongRequest]):
+    """Add several songs to a playlist at once"""
+    try:
+        playlist = playlist_service.add_songs_bulk(playlist_id, [song.model_dump() for song in songs])
+        if not playlist:
+            raise HTTPException(status_code=404, detail="Playlist not found")
+        return playlist
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/playlists/{playlist_id}/songs/{song_id}")
 async def remove_song_from_playlist(playlist_id: str, song_id: str):
     """Remove a song from a playlist"""
@@ -314,35 +391,68 @@ async def reorder_playlist(playlist_id: str, song_indices: List[int]):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/playlists/{playlist_id}/play")
-async def play_playlist(playlist_id: str, shuffle: bool = False):
+async def play_playlist(
+    playlist_id: str,
+    response: Response,
+    shuffle: bool = False,
+    seed: Optional[int] = Query(None, description="Seed for a reproducible shuffle"),
+    cached: bool = Query(False, description="Return only play_order; the client already has the songs"),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get playlist in play order (optionally shuffled)"""
     try:
         playlist = playlist_service.get_playlist(playlist_id)
         if not playlist:
             raise HTTPException(status_code=404, detail="Playlist not found")
         
-        songs = playlist["songs"].copy()
+        # Unseeded shuffles differ on every call, so only deterministic orders get an ETag
+        if not shuffle or seed is not None:
+            key = f"{playlist_id}:{playlist['updated_at']}:{shuffle}:{seed}:{cached}"
+            etag = f'"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}"'
+            if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+        
+        # Shuffle positions rather than copying the song dicts
+        songs = playlist["songs"]
+        order = list(range(len(songs)))
         if shuffle:
-            import random
-            random.shuffle(songs)
+            rng = random.Random(seed) if seed is not None else random
+            rng.shuffle(order)
         
-        return {
+        result = {
             "playlist_id": playlist_id,
             "playlist_name": playlist["name"],
-            "songs": songs,
+            "play_order": order,
             "total_songs": len(songs),
             "shuffled": shuffle
         }
+        if not cached:
+            result["songs"] = [songs[i] for i in order] if shuffle else songs
+        return result
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.on_event("startup")
+async def startup_event():
+    _service_logger.addHandler(_log_handler)
+    _log_listener.start()
+    await playlist_service.start()
+    await youtube_service.start()
+
 # Cleanup on shutdown
 @app.on_event("shutdown")
 async def shutdown_event():
-    youtube_service.cleanup_temp_files()
+    await playlist_service.close()
+    await youtube_service.close()
+    _service_logger.removeHandler(_log_handler)
+    _log_listener.stop()
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # uvloop has no Windows build; elsewhere both ship with uvicorn[standard]
+    loop = "asyncio" if sys.platform == "win32" else "uvloop"
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop=loop, http="httptools") 
\ No newline at end of file
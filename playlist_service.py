@@ -1,33 +1,141 @@
-import json
 import os
-from typing import List, Dict, Optional
+import re
+import asyncio
+import heapq
+import hashlib
+from operator import itemgetter
+from typing import List, Dict, Optional, Set, Tuple
 from datetime import datetime
 import uuid
+import aiofiles
+import aiofiles.os
+import orjson
+
+# Seconds to wait after a change so bursts of edits share one write
+SAVE_DELAY = 0.5
+
+_fsync = aiofiles.os.wrap(os.fsync)
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+# "M:SS" or "H:MM:SS" as produced by the search results
+_DUR_RE = re.compile(r'^(?:(\d+):)?(\d+):(\d{1,2})$')
+
+def _parse_duration(duration: str) -> int:
+    """Convert a duration string to seconds, or 0 if it can't be parsed"""
+    match = _DUR_RE.match(duration)
+    if not match:
+        return 0
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
 
 class PlaylistService:
     def __init__(self):
         self.playlists_file = "playlists.json"
-        self.playlists = self.load_playlists()
+        self._last_hash = None  # Digest of the file contents last read or written
+        self.playlists = {}
+        self._rebuild_indexes()
+        # Created in start() so it binds to the running loop, not the one current at import
+        self._dirty: Optional[asyncio.Event] = None
+        self._flush_task = None
+        self._closing = False
     
-    def load_playlists(self) -> Dict:
+    async def load_playlists(self) -> Dict:
         """Load playlists from JSON file"""
+        # Treat a missing or unreadable file as an empty library that needs no write yet
+        self._last_hash = _digest(orjson.dumps({}, option=orjson.OPT_INDENT_2))
         try:
-            if os.path.exists(self.playlists_file):
-                with open(self.playlists_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            if await aiofiles.os.path.exists(self.playlists_file):
+                async with aiofiles.open(self.playlists_file, 'rb') as f:
+                    data = await f.read()
+                playlists = orjson.loads(data)
+                self._last_hash = _digest(data)
+                return playlists
             return {}
         except Exception as e:
             print(f"Error loading playlists: {e}")
             return {}
     
-    def save_playlists(self):
+    def _rebuild_indexes(self):
+        """Rebuild in-memory lookup tables from the loaded playlists"""
+        # Song ids per playlist, so membership checks don't scan the song list
+        self._song_ids: Dict[str, Set[str]] = {
+            playlist_id: {song["id"] for song in playlist["songs"]}
+            for playlist_id, playlist in self.playlists.items()
+        }
+        # Lowercased (name, description) per playlist for search
+        self._search_keys: Dict[str, Tuple[str, str]] = {
+            playlist_id: self._search_key(playlist)
+            for playlist_id, playlist in self.playlists.items()
+        }
+        # Library-wide totals, kept up to date by the mutation methods
+        self._totals = {
+            "songs": sum(len(playlist["songs"]) for playlist in self.playlists.values()),
+            "duration": sum(playlist.get("total_duration", 0) for playlist in self.playlists.values())
+        }
+    
+    @staticmethod
+    def _search_key(playlist: Dict) -> Tuple[str, str]:
+        # The API allows a null description
+        return playlist["name"].lower(), (playlist.get("description") or "").lower()
+    
+    async def save_playlists(self):
         """Save playlists to JSON file"""
         try:
-            with open(self.playlists_file, 'w', encoding='utf-8') as f:
-                json.dump(self.playlists, f, indent=2, ensure_ascii=False)
+            data = orjson.dumps(self.playlists, option=orjson.OPT_INDENT_2)
+            digest = _digest(data)
+            if digest == self._last_hash:
+                return  # Nothing changed since the last write
+            
+            # Write a temp file and swap it in so a crash never leaves a truncated file
+            tmp_file = self.playlists_file + ".tmp"
+            async with aiofiles.open(tmp_file, 'wb') as f:
+                await f.write(data)
+                await f.flush()
+                await _fsync(f.fileno())
+            await aiofiles.os.replace(tmp_file, self.playlists_file)
+            self._last_hash = digest
         except Exception as e:
             print(f"Error saving playlists: {e}")
     
+    async def start(self):
+        """Load playlists and start the background task that persists changes"""
+        self.playlists = await self.load_playlists()
+        self._rebuild_indexes()
+        if self._dirty is None:
+            self._dirty = asyncio.Event()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flusher())
+    
+    async def close(self):
+        """Stop the background task and write any pending changes"""
+        if self._flush_task is not None:
+            # Wake the flusher and let it finish rather than cancelling it: a cancelled
+            # write keeps running in its worker thread and would race the final save
+            self._closing = True
+            self._dirty.set()
+            try:
+                await self._flush_task
+            except Exception as e:
+                print(f"Error stopping playlist saver: {e}")
+            self._flush_task = None
+        await self.save_playlists()
+    
+    def _mark_dirty(self):
+        """Schedule a save; before start() changes are written by close()"""
+        if self._dirty is not None:
+            self._dirty.set()
+    
+    async def _flusher(self):
+        """Coalesce changes made within SAVE_DELAY into a single write until close() is called"""
+        while not self._closing:
+            await self._dirty.wait()
+            if not self._closing:
+                await asyncio.sleep(SAVE_DELAY)
+            self._dirty.clear()
+            await self.save_playlists()
+    
     def create_playlist(self, name: str, description: str = "") -> Dict:
         """Create a new playlist"""
         playlist_id = str(uuid.uuid4())
@@ -41,8 +149,11 @@ class PlaylistService:
             "total_duration": 0
         }
         
+        search_key = self._search_key(playlist)
         self.playlists[playlist_id] = playlist
-        self.save_playlists()
+        self._song_ids[playlist_id] = set()
+        self._search_keys[playlist_id] = search_key
+        self._mark_dirty()
         return playlist
     
     def get_playlist(self, playlist_id: str) -> Optional[Dict]:
@@ -64,55 +175,79 @@ class PlaylistService:
         if description is not None:
             playlist["description"] = description
         playlist["updated_at"] = datetime.now().isoformat()
+        self._search_keys[playlist_id] = self._search_key(playlist)
         
-        self.save_playlists()
+        self._mark_dirty()
         return playlist
     
     def delete_playlist(self, playlist_id: str) -> bool:
         """Delete a playlist"""
         if playlist_id in self.playlists:
-            del self.playlists[playlist_id]
-            self.save_playlists()
+            playlist = self.playlists.pop(playlist_id)
+            self._song_ids.pop(playlist_id, None)
+            self._search_keys.pop(playlist_id, None)
+            self._totals["songs"] -= len(playlist["songs"])
+            self._totals["duration"] -= playlist.get("total_duration", 0)
+            self._mark_dirty()
             return True
         return False
     
-    def add_song_to_playlist(self, playlist_id: str, song: Dict) -> Optional[Dict]:
-        """Add a song to a playlist"""
-        if playlist_id not in self.playlists:
-            return None
-        
+    def _append_song(self, playlist_id: str, song: Dict, added_at: str) -> bool:
+        """Append a song unless it's already in the playlist; returns whether it was added"""
         playlist = self.playlists[playlist_id]
+        song_ids = self._song_ids[playlist_id]
         
         # Check if song already exists in playlist
-        for existing_song in playlist["songs"]:
-            if existing_song["id"] == song["id"]:
-                return playlist  # Song already exists
+        if song["id"] in song_ids:
+            return False
+        
+        duration_seconds = _parse_duration(song["duration"])
         
         # Add song with additional metadata
         song_data = {
-            "id": song["id"],
-            "title": song["title"],
-            "channel": song["channel"],
-            "duration": song["duration"],
-            "thumbnail": song["thumbnail"],
-            "url": song["url"],
-            "added_at": datetime.now().isoformat()
+            **song,
+            "duration_seconds": duration_seconds,
+            "added_at": added_at
         }
         
         playlist["songs"].append(song_data)
-        playlist["updated_at"] = datetime.now().isoformat()
+        song_ids.add(song["id"])
         
-        # Update total duration (convert duration string to seconds for calculation)
-        try:
-            duration_parts = song["duration"].split(":")
-            if len(duration_parts) == 2:
-                minutes, seconds = map(int, duration_parts)
-                duration_seconds = minutes * 60 + seconds
-                playlist["total_duration"] += duration_seconds
-        except:
-            pass  # If duration parsing fails, skip duration update
-        
-        self.save_playlists()
+        # Update total duration (unparseable durations count as 0)
+        playlist["total_duration"] += duration_seconds
+        self._totals["songs"] += 1
+        self._totals["duration"] += duration_seconds
+        return True
+    
+    def add_song_to_playlist(self, playlist_id: str, song: Dict) -> Optional[Dict]:
+        """Add a song to a playlist"""
+        if playlist_id not in self.playlists:
+            return None
+        
+        playlist = self.playlists[playlist_id]
+        now = datetime.now().isoformat()
+        if not self._append_song(playlist_id, song, now):
+            return playlist  # Song already exists
+        
+        playlist["updated_at"] = now
+        self._mark_dirty()
+        return playlist
+    
+    def add_songs_bulk(self, playlist_id: str, songs: List[Dict]) -> Optional[Dict]:
+        """Add several songs to a playlist with a single update and save"""
+        if playlist_id not in self.playlists:
+            return None
+        
+        playlist = self.playlists[playlist_id]
+        now = datetime.now().isoformat()
+        added = False
+        for song in songs:
+            if self._append_song(playlist_id, song, now):
+                added = True
+        
+        if added:
+            playlist["updated_at"] = now
+            self._mark_dirty()
         return playlist
     
     def remove_song_from_playlist(self, playlist_id: str, song_id: str) -> Optional[Dict]:
@@ -121,24 +256,27 @@ class PlaylistService:
             return None
         
         playlist = self.playlists[playlist_id]
+        song_ids = self._song_ids[playlist_id]
+        if song_id not in song_ids:
+            return playlist  # Song not found, but return playlist anyway
         
         # Find and remove the song
         for i, song in enumerate(playlist["songs"]):
             if song["id"] == song_id:
                 removed_song = playlist["songs"].pop(i)
+                song_ids.discard(song_id)
                 playlist["updated_at"] = datetime.now().isoformat()
                 
-                # Update total duration
-                try:
-                    duration_parts = removed_song["duration"].split(":")
-                    if len(duration_parts) == 2:
-                        minutes, seconds = map(int, duration_parts)
-                        duration_seconds = minutes * 60 + seconds
-                        playlist["total_duration"] = max(0, playlist["total_duration"] - duration_seconds)
-                except:
-                    pass
+                # Update total duration (songs saved before duration_seconds existed are parsed here)
+                duration_seconds = removed_song.get("duration_seconds")
+                if duration_seconds is None:
+                    duration_seconds = _parse_duration(removed_song["duration"])
+                previous_duration = playlist["total_duration"]
+                playlist["total_duration"] = max(0, previous_duration - duration_seconds)
+                self._totals["songs"] -= 1
+                self._totals["duration"] -= previous_duration - playlist["total_duration"]
                 
-                self.save_playlists()
+                self._mark_dirty()
                 return playlist
         
         return playlist  # Song not found, but return playlist anyway
@@ -151,25 +289,23 @@ class PlaylistService:
         playlist = self.playlists[playlist_id]
         songs = playlist["songs"]
         
-        if len(song_indices) != len(songs):
+        # Indices must be a permutation, otherwise songs would be dropped or duplicated
+        if len(song_indices) != len(songs) or set(song_indices) != set(range(len(songs))):
             return None  # Invalid indices
         
-        try:
-            # Reorder songs based on provided indices
-            reordered_songs = [songs[i] for i in song_indices]
-            playlist["songs"] = reordered_songs
-            playlist["updated_at"] = datetime.now().isoformat()
-            
-            self.save_playlists()
-            return playlist
-        except (IndexError, ValueError):
-            return None  # Invalid indices
+        # Reorder songs based on provided indices (itemgetter returns a bare item for one index)
+        if len(songs) > 1:
+            playlist["songs"] = list(itemgetter(*song_indices)(songs))
+        playlist["updated_at"] = datetime.now().isoformat()
+        
+        self._mark_dirty()
+        return playlist
     
     def get_playlist_stats(self) -> Dict:
         """Get statistics about all playlists"""
         total_playlists = len(self.playlists)
-        total_songs = sum(len(playlist["songs"]) for playlist in self.playlists.values())
-        total_duration = sum(playlist.get("total_duration", 0) for playlist in self.playlists.values())
+        total_songs = self._totals["songs"]
+        total_duration = self._totals["duration"]
         
         # Convert total duration to readable format
         hours = total_duration // 3600
@@ -188,18 +324,13 @@ class PlaylistService:
     def search_playlists(self, query: str) -> List[Dict]:
         """Search playlists by name or description"""
         query = query.lower()
-        results = []
-        
-        for playlist in self.playlists.values():
-            if (query in playlist["name"].lower() or 
-                query in playlist.get("description", "").lower()):
-                results.append(playlist)
-        
-        return results
+        return [
+            self.playlists[playlist_id]
+            for playlist_id, (name, description) in self._search_keys.items()
+            if query in name or query in description
+        ]
     
     def get_recent_playlists(self, limit: int = 5) -> List[Dict]:
         """Get recently updated playlists"""
-        all_playlists = list(self.playlists.values())
-        # Sort by updated_at in descending order
-        all_playlists.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-        return all_playlists[:limit] 
\ No newline at end of file
+        # Only the top `limit` entries are kept, so this is O(N log limit)
+        return heapq.nlargest(limit, self.playlists.values(), key=lambda x: x.get("updated_at", "")) 
\ No newline at end of file
@@ -26,7 +26,9 @@ def check_dependencies():
         'youtubesearchpython',
         'httpx',
         'aiofiles',
-        'pydantic'
+        'pydantic',
+        'orjson',
+        'cachetools'
     ]
     
     missing_packages = []
@@ -83,14 +85,20 @@ def start_server():
     print("🌐 Web Client: Open client.html in your browser")
     print("\n⏹️  Press Ctrl+C to stop the server\n")
     
+    command = [
+        sys.executable, "-m", "uvicorn", 
+        "main:app", 
+        "--host", "0.0.0.0", 
+        "--port", "8000", 
+        "--http", "httptools",
+        "--reload"
+    ]
+    # uvloop has no Windows build
+    if sys.platform != "win32":
+        command += ["--loop", "uvloop"]
+    
     try:
-        subprocess.run([
-            sys.executable, "-m", "uvicorn", 
-            "main:app", 
-            "--host", "0.0.0.0", 
-            "--port", "8000", 
-            "--reload"
-        ])
+        subprocess.run(command)
     except KeyboardInterrupt:
         print("\n\n👋 Server stopped")
     except Exception as e:
@@ -1,203 +1,614 @@
 import os
 import tempfile
 import asyncio
-from typing import List, Dict, Optional
+import time
+import threading
+import shutil
+import types
+import logging
+import itertools
+import multiprocessing
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple, Union
 import yt_dlp
+import orjson
+import aiofiles.os
+from cachetools import TTLCache, TLRUCache
 import httpx
 from pathlib import Path
-import json
 import re
 
+logger = logging.getLogger(__name__)
+
+# Maximum yt-dlp operations in flight; extra requests wait instead of piling onto YouTube
+YTDL_CONCURRENCY = 8
+
+# Worker processes for stream extraction, which is CPU-bound and would otherwise hold the GIL
+YTDL_PROCESSES = min(4, os.cpu_count() or 1)
+
+# Dedicated threads for blocking yt-dlp calls, kept apart from asyncio's shared default
+# executor; downloads get their own small pool so long FFmpeg jobs can't starve searches
+SEARCH_THREADS = YTDL_CONCURRENCY
+DOWNLOAD_THREADS = 2
+
+# Persistent yt-dlp cache (player JS signature functions) reused across restarts
+YTDL_CACHE_DIR = os.getenv(
+    "YTDL_CACHE_DIR",
+    os.path.join(os.path.expanduser('~'), '.cache', 'spotify_stream_ytdlp')
+)
+
+# Upper bound on how long a resolved stream URL is reused
+STREAM_CACHE_TTL = 3 * 3600
+# Drop cached URLs this many seconds before YouTube's signature expires
+STREAM_EXPIRY_MARGIN = 300
+
+# Bytes forwarded per chunk when proxying audio from the CDN
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 256 * 1024))
+
+# Headers a ranged CDN response carries that the proxied response must repeat
+_FORWARDED_STREAM_HEADERS = ('Content-Length', 'Content-Range')
+
+# CDN statuses meaning a signed URL can't be used anymore
+_REJECTED_URL_STATUSES = (403, 410)
+
+# Downloaded MP3s kept on disk for reuse; least recently used are evicted past either limit
+DOWNLOAD_CACHE_MAX_FILES = 200
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Background sweep interval, and how long an unused download may stay
+DOWNLOAD_GC_INTERVAL = 3600
+DOWNLOAD_MAX_AGE = 24 * 3600
+
+def _url_ttl(url: str) -> float:
+    """Seconds a signed URL can still be reused: until its expiry or STREAM_CACHE_TTL"""
+    ttl = STREAM_CACHE_TTL
+    expire = parse_qs(urlparse(url).query).get('expire')
+    if expire and expire[0].isdigit():
+        ttl = min(ttl, int(expire[0]) - time.time() - STREAM_EXPIRY_MARGIN)
+    return ttl
+
+def _stream_ttu(_video_id: str, info: Dict, now: float) -> float:
+    return now + _url_ttl(info['audio_url'])
+
+def _info_ttu(_video_id: str, entry: Tuple[str, bytes], now: float) -> float:
+    return now + _url_ttl(entry[0])
+
+# Bulky info fields an audio download never reads
+_UNUSED_INFO_KEYS = ('automatic_captions', 'subtitles', 'thumbnails', 'heatmap')
+
+def _download_info(info: Dict) -> Optional[bytes]:
+    """Trim extracted info to what a later audio download needs, serialized as JSON"""
+    info = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+    for key in _UNUSED_INFO_KEYS:
+        info.pop(key, None)
+    audio_formats = [f for f in info.get('formats') or () if f.get('vcodec') == 'none']
+    if audio_formats:
+        info['formats'] = audio_formats
+    # Bytes pickle across the process pool at memcpy cost and take far less memory than nested dicts
+    try:
+        return orjson.dumps(info)
+    except orjson.JSONEncodeError:
+        return None  # Downloads of this video will extract again
+
+# URL templates, bound once; called with a video id
+_WATCH_URL = "https://www.youtube.com/watch?v={}".format
+# mqdefault always exists (unlike maxresdefault) and needs no thumbnails list
+_THUMBNAIL_URL = "https://img.youtube.com/vi/{}/mqdefault.jpg".format
+
+# View-count thresholds, largest first
+_VIEW_UNITS = ((1_000_000, 'M'), (1_000, 'K'))
+
+@dataclass
+class VideoResult:
+    """A search result; URLs are derived from the id only when serialized"""
+    # Declared by hand (dataclass(slots=True) needs Python 3.10) so cached results carry no __dict__
+    __slots__ = ('id', 'title', 'channel', 'duration', 'views')
+    id: str
+    title: str
+    channel: str
+    duration: str
+    views: str
+    
+    @property
+    def thumbnail(self) -> str:
+        return _THUMBNAIL_URL(self.id)
+    
+    @property
+    def url(self) -> str:
+        return _WATCH_URL(self.id)
+    
+    def to_dict(self) -> Dict:
+        """Convert to the search result dict returned by the API"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'channel': self.channel,
+            'duration': self.duration,
+            'views': self.views,
+            'thumbnail': self.thumbnail,
+            'url': self.url
+        }
+
+def _format_entry(video: Dict) -> VideoResult:
+    """Convert a flat yt-dlp search entry into a search result"""
+    g = video.get
+    video_id = video['id']
+    
+    # Format duration
+    duration = g('duration')
+    if duration and isinstance(duration, (int, float)):
+        minutes, seconds = divmod(int(duration), 60)
+        duration_str = f"{minutes}:{seconds:02d}"
+    else:
+        duration_str = "Live" if g('is_live') else "N/A"
+    
+    # Format view count
+    view_count = g('view_count')
+    if view_count and isinstance(view_count, (int, float)):
+        for threshold, suffix in _VIEW_UNITS:
+            if view_count >= threshold:
+                views_str = f"{view_count/threshold:.1f}{suffix} views"
+                break
+        else:
+            views_str = f"{int(view_count)} views"
+    else:
+        views_str = "N/A"
+    
+    return VideoResult(
+        id=video_id,
+        title=g('title', 'Unknown Title'),
+        channel=g('uploader', g('channel', 'Unknown Channel')),
+        duration=duration_str,
+        views=views_str
+    )
+
+# Shared yt-dlp option profiles; read-only, each YoutubeDL gets a copy with its per-instance fields
+_SEARCH_OPTS = types.MappingProxyType({
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': True,
+    'skip_download': True,
+})
+_STREAM_OPTS = types.MappingProxyType({
+    'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'extractaudio': True,
+    'audioformat': 'mp3',
+    'audioquality': '192',
+})
+_DOWNLOAD_OPTS_BASE = types.MappingProxyType({
+    'format': 'bestaudio/best',
+    'postprocessors': ({
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': 'mp3',
+        'preferredquality': '192',
+    },),
+    'quiet': True,
+    'no_warnings': True,
+})
+
+# Per-process YoutubeDL for stream extraction; each pool worker runs one task at a time
+_stream_ydl: Optional[yt_dlp.YoutubeDL] = None
+
+def _extract_stream_info(video_id: str, cache_dir: Union[str, bool]) -> Tuple[Dict, Optional[bytes]]:
+    """Resolve title, duration and best audio URL, plus trimmed info for downloads (runs in a worker process)"""
+    global _stream_ydl
+    url = _WATCH_URL(video_id)
+    
+    if _stream_ydl is None:
+        _stream_ydl = yt_dlp.YoutubeDL({**_STREAM_OPTS, 'cachedir': cache_dir})
+    
+    try:
+        info = _stream_ydl.extract_info(url, download=False)
+    except Exception as e:
+        # yt-dlp errors carry unpicklable state, so only the message is sent back
+        raise Exception(str(e)) from None
+    
+    title = info.get('title', 'Unknown')
+    duration = info.get('duration', 0)
+    
+    # The format selector in _STREAM_OPTS already picked the best audio; yt-dlp copies it to the top level
+    audio_url = info.get('url')
+    
+    if not audio_url:
+        raise Exception("No audio stream found")
+    
+    return {
+        'title': title,
+        'duration': duration,
+        'audio_url': audio_url,
+        'video_id': video_id
+    }, _download_info(info)
+
 class YouTubeService:
     def __init__(self):
-        self.temp_dir = tempfile.mkdtemp()
+        # Spawned pool workers re-import the entry module, so this constructor must not create
+        # directories, processes or clients; start() does that in the serving process only
+        self.temp_dir: Optional[str] = None
+        self.cache_dir: Union[str, bool] = False
+        # Loop-bound, so start() creates it under uvicorn's loop
+        self._ytdl_sem: Optional[asyncio.Semaphore] = None
+        # Downloads queue here first, so only running ones hold a shared yt-dlp permit
+        self._download_sem: Optional[asyncio.Semaphore] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._search_executor = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix='ytdlp-search')
+        self._download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS, thread_name_prefix='ytdlp-download')
+        # Formatted results per (normalized query, limit); users repeat searches as they type and page
+        self._search_cache = TTLCache(maxsize=512, ttl=600)
+        # Resolved stream info per video, kept until shortly before the signed URL expires
+        self._stream_cache = TLRUCache(maxsize=1024, ttu=_stream_ttu)
+        # Trimmed extraction info per video as (signed URL, orjson payload), so a download
+        # after playback skips re-extraction; expires together with the stream URL
+        self._info_cache = TLRUCache(maxsize=128, ttu=_info_ttu)
+        # yt-dlp work currently running, keyed by (operation, argument)
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        # Finished downloads as video_id -> (path, last used, size), oldest first
+        self._downloads: 'OrderedDict[str, Tuple[str, float, int]]' = OrderedDict()
+        self._downloads_size = 0
+        # Leases on downloads whose file a caller hasn't finished sending; eviction skips them
+        self._serving: Dict[str, int] = {}
+        # Evicted directories still being deleted on a worker thread
+        self._deleting: Dict[str, asyncio.Future] = {}
+        self._gc_task = None
+        self._http: Optional[httpx.AsyncClient] = None
+        
+        # YoutubeDL instances are reused per executor thread so extractor setup, the HTTP
+        # session and player JS state carry over between calls; they aren't thread-safe
+        self._local = threading.local()
+        self._ydl_instances: List[yt_dlp.YoutubeDL] = []
+        self._search_opts: Dict = {}
+        self._download_opts: Dict = {}
+        
+    def _thread_ydl(self, profile: str, ydl_opts: Dict) -> yt_dlp.YoutubeDL:
+        """Return this thread's YoutubeDL for the given option profile, creating it once"""
+        ydl = getattr(self._local, profile, None)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(ydl_opts)
+            setattr(self._local, profile, ydl)
+            self._ydl_instances.append(ydl)
+        return ydl
+    
+    async def _coalesce(self, key: Tuple, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run factory() once for concurrent callers sharing a key; they all await the same result"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            
+            def forget(done: asyncio.Task):
+                if self._inflight.get(key) is done:
+                    del self._inflight[key]
+            task.add_done_callback(forget)
         
+        # Shielded so one caller disconnecting doesn't cancel the work the others wait on
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    def _prepare_cache_dir() -> Union[str, bool]:
+        """Create the yt-dlp cache dir; yt-dlp silently skips caching if it isn't writable"""
+        try:
+            os.makedirs(YTDL_CACHE_DIR, exist_ok=True)
+            if os.access(YTDL_CACHE_DIR, os.W_OK):
+                return YTDL_CACHE_DIR
+        except OSError:
+            pass
+        logger.warning("yt-dlp cache dir %s is not writable; signature caching disabled", YTDL_CACHE_DIR)
+        return False
+    
     async def search_videos(self, query: str, limit: int = 10) -> List[Dict]:
         """Search for videos on YouTube using yt-dlp"""
+        key = (query.strip().lower(), limit)
+        cached = self._search_cache.get(key)
+        if cached is not None:
+            return [result.to_dict() for result in cached]
+        
+        async def search():
+            results = await self._search(query, limit)
+            if results is None:
+                return []  # Search failed; don't cache the empty result
+            self._search_cache[key] = results
+            return results
+        
+        # Identical concurrent searches share one yt-dlp call instead of each running their own
+        results = await self._coalesce(('search', key), search)
+        return [result.to_dict() for result in results]
+    
+    async def _search(self, query: str, limit: int) -> Optional[List[VideoResult]]:
+        """Run a yt-dlp search and format the entries; None if yt-dlp failed"""
         try:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             
             def perform_search():
                 # Create search query for yt-dlp
                 search_query = f"ytsearch{limit}:{query}"
                 
-                ydl_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extract_flat': True,
-                    'skip_download': True,
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    try:
-                        # Extract info for search results
-                        search_results = ydl.extract_info(search_query, download=False)
-                        return search_results
-                    except Exception as e:
-                        print(f"Search error: {e}")
-                        return None
-            
-            results = await loop.run_in_executor(None, perform_search)
+                ydl = self._thread_ydl('search', self._search_opts)
+                try:
+                    # Extract info for search results
+                    search_results = ydl.extract_info(search_query, download=False)
+                    return search_results
+                except Exception:
+                    logger.exception("Search error")
+                    return None
             
-            formatted_results = []
-            if results and 'entries' in results:
-                for video in results['entries']:
-                    if video and video.get('id'):
-                        # Format duration
-                        duration = video.get('duration')
-                        if duration and isinstance(duration, (int, float)):
-                            minutes = int(duration) // 60
-                            seconds = int(duration) % 60
-                            duration_str = f"{minutes}:{seconds:02d}"
-                        else:
-                            duration_str = "Live" if video.get('is_live') else "N/A"
-                        
-                        # Format view count
-                        view_count = video.get('view_count')
-                        if view_count and isinstance(view_count, (int, float)):
-                            if view_count >= 1000000:
-                                views_str = f"{view_count/1000000:.1f}M views"
-                            elif view_count >= 1000:
-                                views_str = f"{view_count/1000:.1f}K views"
-                            else:
-                                views_str = f"{int(view_count)} views"
-                        else:
-                            views_str = "N/A"
-                        
-                        # Get thumbnail URL
-                        thumbnail_url = None
-                        if video.get('thumbnails'):
-                            # Get the best quality thumbnail
-                            thumbnails = video['thumbnails']
-                            if thumbnails:
-                                thumbnail_url = thumbnails[-1].get('url')  # Last one is usually highest quality
-                        
-                        if not thumbnail_url:
-                            # Fallback to YouTube's default thumbnail format
-                            thumbnail_url = f"https://img.youtube.com/vi/{video['id']}/maxresdefault.jpg"
-                        
-                        formatted_results.append({
-                            'id': video['id'],
-                            'title': video.get('title', 'Unknown Title'),
-                            'channel': video.get('uploader', video.get('channel', 'Unknown Channel')),
-                            'duration': duration_str,
-                            'views': views_str,
-                            'thumbnail': thumbnail_url,
-                            'url': f"https://www.youtube.com/watch?v={video['id']}"
-                        })
+            async with self._ytdl_sem:
+                results = await loop.run_in_executor(self._search_executor, perform_search)
+            if results is None:
+                return None
             
-            return formatted_results[:limit]  # Ensure we don't exceed the limit
+            # Stop after `limit` usable entries so extra ones are never formatted
+            entries = (video for video in results.get('entries') or () if video and video.get('id'))
+            return [_format_entry(video) for video in itertools.islice(entries, limit)]
             
         except Exception as e:
             raise Exception(f"Error searching videos: {str(e)}")
     
     async def get_audio_stream_url(self, video_id: str) -> Dict:
         """Get direct audio stream URL for a YouTube video"""
+        cached = self._stream_cache.get(video_id)
+        if cached is not None:
+            return cached
+        
+        async def resolve():
+            info, download_info = await self._resolve_stream(video_id)
+            self._stream_cache[video_id] = info
+            if download_info is not None:
+                self._info_cache[video_id] = (info['audio_url'], download_info)
+            return info
+        
+        # Concurrent requests for the same video share one extraction
+        return await self._coalesce(('stream', video_id), resolve)
+    
+    async def _resolve_stream(self, video_id: str) -> Tuple[Dict, Optional[bytes]]:
+        """Run stream extraction in the process pool"""
         try:
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            
-            ydl_opts = {
-                'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-                'noplaylist': True,
-                'quiet': True,
-                'no_warnings': True,
-                'extractaudio': True,
-                'audioformat': 'mp3',
-                'audioquality': '192',
-            }
-            
-            loop = asyncio.get_event_loop()
-            
-            def extract_info():
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    return ydl.extract_info(url, download=False)
-            
-            info = await loop.run_in_executor(None, extract_info)
+            loop = asyncio.get_running_loop()
             
-            # Find the best audio format
-            audio_url = None
-            title = info.get('title', 'Unknown')
-            duration = info.get('duration', 0)
-            
-            # Try to get the direct URL
-            if 'url' in info:
-                audio_url = info['url']
-            elif 'formats' in info:
-                # Look for audio-only formats first
-                audio_formats = [f for f in info['formats'] 
-                               if f.get('acodec') != 'none' and f.get('vcodec') == 'none']
-                
-                if audio_formats:
-                    # Sort by quality and get the best one
-                    best_audio = max(audio_formats, 
-                                   key=lambda x: x.get('abr', 0) or x.get('tbr', 0) or 0)
-                    audio_url = best_audio.get('url')
-                else:
-                    # Fallback to any format with audio
-                    for fmt in info['formats']:
-                        if fmt.get('acodec') != 'none' and fmt.get('url'):
-                            audio_url = fmt.get('url')
-                            break
-            
-            if not audio_url:
-                raise Exception("No audio stream found")
-            
-            return {
-                'title': title,
-                'duration': duration,
-                'audio_url': audio_url,
-                'video_id': video_id
-            }
+            # Only the summary and trimmed info cross the process boundary, not the full info
+            async with self._ytdl_sem:
+                pool = self._process_pool
+                try:
+                    return await loop.run_in_executor(pool, _extract_stream_info, video_id, self.cache_dir)
+                except BrokenProcessPool:
+                    # A dead worker (OOM, crash) breaks the pool for good; replace it once and retry
+                    if self._process_pool is pool:
+                        pool.shutdown(wait=False)
+                        self._process_pool = self._new_process_pool()
+                    return await loop.run_in_executor(
+                        self._process_pool, _extract_stream_info, video_id, self.cache_dir
+                    )
             
         except Exception as e:
             raise Exception(f"Error getting audio stream: {str(e)}")
     
-    async def download_audio(self, video_id: str) -> str:
-        """Download audio as MP3 file and return file path"""
+    def forget_stream(self, video_id: str):
+        """Drop cached stream and download info for a video so the next request resolves it again"""
+        self._stream_cache.pop(video_id, None)
+        self._info_cache.pop(video_id, None)
+    
+    async def stream_audio(
+        self, video_id: str, range_header: Optional[str] = None
+    ) -> Tuple[Dict, int, Dict[str, str], AsyncIterator[bytes], Callable[[], Awaitable[None]]]:
+        """Open the CDN audio stream; returns stream info, status, headers to forward, the body and close"""
+        # The caller must await close() however the response ends: the body may never be iterated
+        was_cached = self._stream_cache.get(video_id) is not None
+        stream_info = await self.get_audio_stream_url(video_id)
+        
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+        if range_header:
+            headers['Range'] = range_header  # Lets players seek without fetching the whole file
+        
+        request = self._http.build_request('GET', stream_info['audio_url'], headers=headers)
+        response = await self._http.send(request, stream=True)
+        if response.status_code in _REJECTED_URL_STATUSES:
+            # The signed URL was revoked or no longer matches our IP; drop it so other
+            # endpoints don't keep handing it out, and resolve once more if it came from the cache
+            await response.aclose()
+            self.forget_stream(video_id)
+            if was_cached:
+                stream_info = await self.get_audio_stream_url(video_id)
+                request = self._http.build_request('GET', stream_info['audio_url'], headers=headers)
+                response = await self._http.send(request, stream=True)
+        if response.status_code not in (200, 206):
+            await response.aclose()
+            raise Exception(f"HTTP {response.status_code}")
+        
+        forwarded = {
+            name: response.headers[name]
+            for name in _FORWARDED_STREAM_HEADERS
+            if name in response.headers
+        }
+        if 'Content-Encoding' in response.headers:
+            forwarded.pop('Content-Length', None)  # The body is decoded, so the length would be wrong
+        
+        async def body():
+            try:
+                async for chunk in response.aiter_bytes(chunk_size=STREAM_CHUNK_SIZE):
+                    if chunk:
+                        yield chunk
+            except Exception as e:
+                logger.error("Streaming error: %s", e)
+                raise
+        
+        return stream_info, response.status_code, forwarded, body(), response.aclose
+    
+    async def download_audio(self, video_id: str, info: Optional[Dict] = None) -> str:
+        """Download audio as MP3 file and return file path; call release_download() once it is sent"""
+        # Leased up front so eviction can't delete the file before the caller has served it
+        self._serving[video_id] = self._serving.get(video_id, 0) + 1
         try:
-            url = f"https://www.youtube.com/watch?v={video_id}"
-            output_path = os.path.join(self.temp_dir, f"{video_id}.%(ext)s")
-            
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': output_path,
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'quiet': True,
-                'no_warnings': True,
-            }
+            # Concurrent downloads of one video would write the same file, so they share one run
+            return await self._coalesce(('download', video_id), lambda: self._download(video_id, info))
+        except BaseException:
+            self.release_download(video_id)
+            raise
+    
+    def release_download(self, video_id: str):
+        """Drop a lease taken by download_audio so the file can be evicted again"""
+        count = self._serving.get(video_id, 0) - 1
+        if count > 0:
+            self._serving[video_id] = count
+        else:
+            self._serving.pop(video_id, None)
+    
+    async def _download(self, video_id: str, info: Optional[Dict]) -> str:
+        """Download and convert one video's audio on the download executor"""
+        try:
+            cached = self._downloads.get(video_id)
+            if cached is not None and await aiofiles.os.path.exists(cached[0]):
+                return self._track_download(video_id, cached[0], cached[2])
             
-            loop = asyncio.get_event_loop()
+            # A fresh download must not race the deletion of an evicted copy in the same directory
+            deletion = self._deleting.get(video_id)
+            if deletion is not None:
+                await deletion
             
-            def download():
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
+            url = _WATCH_URL(video_id)
+            if info is not None:
+                payload = _download_info(info)  # None if it can't be serialized; extract again
+            else:
+                entry = self._info_cache.get(video_id)
+                payload = entry[1] if entry is not None else None
             
-            await loop.run_in_executor(None, download)
+            loop = asyncio.get_running_loop()
             
-            # Find the downloaded file
-            mp3_file = os.path.join(self.temp_dir, f"{video_id}.mp3")
-            if os.path.exists(mp3_file):
-                return mp3_file
-            else:
-                # Sometimes the file might have a different name
-                for file in os.listdir(self.temp_dir):
-                    if file.startswith(video_id) and file.endswith('.mp3'):
-                        return os.path.join(self.temp_dir, file)
+            def download():
+                ydl = self._thread_ydl('download', self._download_opts)
+                result = None
+                if payload is not None:
+                    try:
+                        # yt-dlp mutates the info it processes; decoding gives it a fresh copy
+                        result = ydl.process_ie_result(orjson.loads(payload), download=True)
+                    except Exception:
+                        pass  # e.g. the signed URLs were rejected; extract again below
+                if result is None:
+                    result = ydl.extract_info(url, download=True)
                 
-                raise Exception("Downloaded file not found")
+                # yt-dlp names the file from the template; FFmpegExtractAudio only swaps the extension
+                mp3_file = os.path.splitext(ydl.prepare_filename(result))[0] + '.mp3'
+                try:
+                    return mp3_file, os.path.getsize(mp3_file)
+                except OSError:
+                    raise Exception("Downloaded file not found")
+            
+            async with self._download_sem, self._ytdl_sem:
+                mp3_file, size = await loop.run_in_executor(self._download_executor, download)
+            return self._track_download(video_id, mp3_file, size)
                 
         except Exception as e:
             raise Exception(f"Error downloading audio: {str(e)}")
     
+    def _track_download(self, video_id: str, path: str, size: int) -> str:
+        """Mark a download as most recently used and evict old ones past the cache limits"""
+        previous = self._downloads.pop(video_id, None)
+        if previous is not None:
+            self._downloads_size -= previous[2]
+        self._downloads[video_id] = (path, time.time(), size)
+        self._downloads_size += size
+        
+        # Oldest first; files still being served (including this one) are skipped
+        for old_id in list(self._downloads):
+            if (len(self._downloads) <= DOWNLOAD_CACHE_MAX_FILES
+                    and self._downloads_size <= DOWNLOAD_CACHE_MAX_BYTES):
+                break
+            if old_id not in self._serving:
+                self._evict_download(old_id)
+        return path
+    
+    def _evict_download(self, video_id: str):
+        """Forget a download and delete its directory on a worker thread"""
+        _, _, size = self._downloads.pop(video_id)
+        self._downloads_size -= size
+        deletion = asyncio.get_running_loop().run_in_executor(
+            None, shutil.rmtree, os.path.join(self.temp_dir, video_id), True
+        )
+        self._deleting[video_id] = deletion
+        
+        def forget(done: asyncio.Future):
+            if self._deleting.get(video_id) is done:
+                del self._deleting[video_id]
+        deletion.add_done_callback(forget)
+    
+    async def _gc_loop(self):
+        """Periodically delete downloads nobody has asked for in DOWNLOAD_MAX_AGE"""
+        while True:
+            await asyncio.sleep(DOWNLOAD_GC_INTERVAL)
+            cutoff = time.time() - DOWNLOAD_MAX_AGE
+            # Entries are ordered by last use, so stop at the first recent one
+            for video_id, (_, last_used, _) in list(self._downloads.items()):
+                if last_used >= cutoff:
+                    break
+                if video_id not in self._serving:
+                    self._evict_download(video_id)
+    
+    @staticmethod
+    def _new_process_pool() -> ProcessPoolExecutor:
+        """Create the extraction pool; workers start on first use"""
+        # Spawn explicitly: forking once executor threads exist is unsafe,
+        # and this matches the macOS/Windows default
+        return ProcessPoolExecutor(
+            max_workers=YTDL_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    
+    async def start(self):
+        """Set up loop-bound state and start the background task that expires old downloads"""
+        if self._ytdl_sem is None:
+            self._ytdl_sem = asyncio.Semaphore(YTDL_CONCURRENCY)
+            self._download_sem = asyncio.Semaphore(DOWNLOAD_THREADS)
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp()
+            self.cache_dir = self._prepare_cache_dir()
+            self._search_opts = {**_SEARCH_OPTS, 'cachedir': self.cache_dir}
+            self._download_opts = {
+                **_DOWNLOAD_OPTS_BASE,
+                'cachedir': self.cache_dir,
+                # One directory per video so eviction removes every file a download left behind
+                'outtmpl': os.path.join(self.temp_dir, '%(id)s', '%(id)s.%(ext)s'),
+            }
+        if self._process_pool is None:
+            self._process_pool = self._new_process_pool()
+        if self._http is None:
+            # Pooled keep-alive connections to the CDN for proxied playback
+            self._http = httpx.AsyncClient(
+                http2=True,
+                follow_redirects=True,
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(max_keepalive_connections=100, max_connections=200, keepalive_expiry=60)
+            )
+        if self._gc_task is None:
+            self._gc_task = asyncio.create_task(self._gc_loop())
+    
+    async def close(self):
+        """Stop worker processes and threads and remove temporary files"""
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except asyncio.CancelledError:
+                pass
+            self._gc_task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
+        self._search_executor.shutdown(wait=False)
+        self._download_executor.shutdown(wait=False)
+        for ydl in self._ydl_instances:
+            ydl.close()
+        self.cleanup_temp_files()
+    
     def cleanup_temp_files(self):
         """Clean up temporary files"""
         try:
-            import shutil
-            if os.path.exists(self.temp_dir):
+            if self.temp_dir and os.path.exists(self.temp_dir):
                 shutil.rmtree(self.temp_dir)
         except Exception:
             pass 
\ No newline at end of file